@@ -1,10 +1,63 @@
 from __future__ import annotations
 
+import hashlib
+import heapq
+import inspect
+import itertools
+import math
+import pickle
 import random
+import sqlite3
+import sys
+import time
+
+from collections import Counter, OrderedDict
+from functools import lru_cache, partial, total_ordering
+from dataclasses import dataclass, field, replace
+from typing import (
+    Callable,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+
+class CardRegistry:
+    """
+    Interns cards as small integer ids. Zones index their count vectors with
+    them and cards compare by them, so two managers that both define e.g.
+    Ash Blossom still agree on which card it is. Cards are interned by all
+    their attributes, so a zone never hands back another manager's card that
+    only shares the name, like Orcust's Jet Synchron with its own discard
+    weight.
+    """
+
+    def __init__(self) -> None:
+        self.ids: Dict[Tuple[str, int, str], int] = {}
+        self.cards: List[Card] = []
 
-from functools import total_ordering
-from dataclasses import dataclass
-from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+    def __len__(self) -> int:
+        return len(self.cards)
+
+    def __getitem__(self, card_id: int) -> Card:
+        return self.cards[card_id]
+
+    def register(self, card: Card) -> int:
+        key = (card.name, card.discard_weight, card.card_type)
+        card_id = self.ids.get(key)
+        if card_id is None:
+            card_id = self.ids[key] = len(self.cards)
+            self.cards.append(card)
+        return card_id
+
+
+CARDS = CardRegistry()
 
 
 @dataclass(order=False)
@@ -13,12 +66,20 @@ class Card:
     name: str
     discard_weight: int
     card_type: str
+    id: int = field(init=False, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        self.id = CARDS.register(self)
+
+    def __reduce__(self) -> Tuple:
+        # ids depend on import order, so let the receiving process assign one
+        return (self.__class__, (self.name, self.discard_weight, self.card_type))
 
     def __hash__(self) -> int:
-        return hash(self.name)
+        return self.id
 
     def __eq__(self, other) -> bool:
-        return self.name == other.name
+        return self is other or (isinstance(other, Card) and self.id == other.id)
 
     def __lt__(self, other) -> bool:
         return self.name.__lt__(other.name)
@@ -31,6 +92,92 @@ class Card:
 
 
 DeckList = Iterable[Tuple[Card, int]]
+# marks a game returned as soon as it met the goal passed to Manager.run
+GOAL_FLAG = "goal reached"
+# marks the best game found before the search ran out of budget
+TRUNCATED_FLAG = "truncated"
+
+FINGERPRINT_MASK = (1 << 64) - 1
+
+# odd multipliers so the same cards in different zones fingerprint differently
+ZONE_MULTIPLIERS = (
+    0x9E3779B97F4A7C15,
+    0xBF58476D1CE4E5B9,
+    0x94D049BB133111EB,
+    0xD6E8FEB86659FD93,
+    0xA0761D6478BD642F,
+    0xE7037ED1A0B428DB,
+)
+
+
+@lru_cache(maxsize=None)
+def zobrist_key(*parts) -> int:
+    # derived from a digest rather than the random module so that keys are
+    # identical in every worker process
+    digest = hashlib.blake2b(repr(parts).encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "little")
+
+
+class FlagRegistry:
+    """
+    Assigns every flag a bit so that a game's flags fit in a single int.
+    Hopts and resources are flags named "hopt-<card>-<tag>" and
+    "used:<resource>", the same names has_flag and reports use.
+    """
+
+    def __init__(self) -> None:
+        self.bits: Dict[str, int] = {}
+        self.names: List[str] = []
+        self.keys: List[int] = []
+        self.hopts: Dict[Tuple[int, object], int] = {}
+        self.resources: Dict[str, int] = {}
+        # every hopt bit of a card, for hopt_available(card, tag=None)
+        self.card_masks: Dict[int, int] = {}
+        # every hopt and resource bit, as opposed to flags that record results
+        self.usage = 0
+
+    def named(self, name: str) -> int:
+        bit = self.bits.get(name)
+        if bit is None:
+            bit = self.bits[name] = 1 << len(self.names)
+            self.names.append(name)
+            self.keys.append(zobrist_key("flag", name))
+        return bit
+
+    def hopt(self, card: Card, tag: object = "*") -> int:
+        bit = self.hopts.get((card.id, tag))
+        if bit is None:
+            bit = self.hopts[(card.id, tag)] = self.named(f"hopt-{card.name}-{tag}")
+            self.card_masks[card.id] = self.card_masks.get(card.id, 0) | bit
+            self.usage |= bit
+        return bit
+
+    def resource(self, resource: str) -> int:
+        bit = self.resources.get(resource)
+        if bit is None:
+            bit = self.resources[resource] = self.named(f"used:{resource}")
+            self.usage |= bit
+        return bit
+
+    def card_mask(self, card: Card) -> int:
+        return self.card_masks.get(card.id, 0)
+
+    def key(self, bit: int) -> int:
+        return self.keys[bit.bit_length() - 1]
+
+    def fingerprint(self, flags: int) -> int:
+        value = 0
+        while flags:
+            bit = flags & -flags
+            value ^= self.key(bit)
+            flags ^= bit
+        return value
+
+    def to_names(self, flags: int) -> List[str]:
+        return [name for (index, name) in enumerate(self.names) if flags >> index & 1]
+
+
+FLAGS = FlagRegistry()
 
 
 @dataclass
@@ -42,50 +189,140 @@ class Disruption:
         return self.name
 
 
-@dataclass
-class CardGroup:
-    cards: List[Card]
+class PendingTriggers:
+    """
+    The @trigger handlers a zone or game has set off since postprocess last
+    looked, as a bitmask kept in its journal. Shared by zones, which watch
+    cards arriving, and games, which watch hopts being spent.
+    """
+
+    journal: Optional[list]
+    pending: int
+
+    def take_pending(self, triggers: int) -> int:
+        """Clear and return whichever of the triggers are pending."""
+        taken = self.pending & triggers
+        if taken:
+            self._set_pending(self.pending ^ taken)
+        return taken
+
+    def _set_pending(self, pending: int) -> None:
+        if self.journal is not None:
+            self.journal.append((self._undo_pending, self.pending))
+        self.pending = pending
+
+    def _undo_pending(self, pending: int) -> None:
+        self.pending = pending
+
+
+class CardGroup(PendingTriggers):
+    """
+    A zone stored as a vector of counts indexed by card id, so membership,
+    counts and copies do not depend on how many cards the zone holds.
+    """
+
+    def __init__(self, cards: Iterable[Card] = ()):
+        self.counts = bytearray(len(CARDS))
+        self.size = 0
+        self._fingerprint = 0
+        # undo log shared with the owning game while it is tracking changes
+        self.journal: Optional[list] = None
+        # card id to the bitmask of triggers its arrival sets off, and the
+        # triggers set off since postprocess last looked, see Manager.watch
+        self.watch: Optional[Dict[int, int]] = None
+        self.pending = 0
+        for card in cards:
+            self._count_in(card)
 
     def __repr__(self) -> str:
         return ", ".join([repr(card) for card in self.cards])
 
+    def __reduce__(self) -> Tuple:
+        return (self.__class__, (self.cards,))
+
     def __eq__(self, other) -> bool:
-        return sorted(self.cards) == sorted(other.cards)
+        return self.fingerprint == other.fingerprint
 
     def __hash__(self) -> int:
-        return hash(sorted(self.cards))
+        return self.fingerprint
 
     def __contains__(self, item) -> bool:
-        return item in self.cards
+        return item.id < len(self.counts) and self.counts[item.id] > 0
 
     def __len__(self) -> int:
-        return len(self.cards)
+        return self.size
 
     def __iter__(self) -> Iterator:
-        return self.cards.__iter__()
+        return iter(self.cards)
+
+    @property
+    def cards(self) -> List[Card]:
+        return [
+            CARDS[card_id]
+            for (card_id, count) in enumerate(self.counts)
+            for _ in range(count)
+        ]
+
+    @property
+    def fingerprint(self) -> int:
+        return self._fingerprint
+
+    def count(self, card: Card) -> int:
+        return self.counts[card.id] if card.id < len(self.counts) else 0
+
+    def _count_in(self, card: Card) -> None:
+        if card.id >= len(self.counts):
+            self.counts.extend(bytes(len(CARDS) - len(self.counts)))
+        count = self.counts[card.id]
+        self.counts[card.id] = count + 1
+        self.size += 1
+        self._fingerprint ^= zobrist_key(card.id, count)
+
+    def _count_out(self, card: Card) -> None:
+        count = self.count(card) - 1
+        if count < 0:
+            raise ValueError(f"{card} is not in {self.__class__.__name__}")
+        self.counts[card.id] = count
+        self.size -= 1
+        self._fingerprint ^= zobrist_key(card.id, count)
 
     def random(self, exclude: List[Card] = []) -> Optional[Card]:
-        if not self.cards:
+        if not self.size:
             return None
-        selected = random.choice(self.cards)
+        cards = self.cards
+        selected = random.choice(cards)
         while selected in exclude:
-            selected = random.choice(self.cards)
+            selected = random.choice(cards)
         return selected
 
     def get_any(self, card_list: List[Card]) -> Optional[Card]:
         for card in card_list:
-            for item in self.cards:
-                if item == card:
-                    return item
+            if card in self:
+                return card
 
     def remove(self, card) -> None:
-        self.cards.remove(card)
+        self._count_out(card)
+        if self.journal is not None:
+            self.journal.append((self._count_in, card))
 
     def add(self, card) -> None:
-        self.cards.append(card)
+        self._count_in(card)
+        if self.journal is not None:
+            self.journal.append((self._count_out, card))
+        if self.watch is not None:
+            triggers = self.watch.get(card.id)
+            if triggers:
+                self._set_pending(self.pending | triggers)
 
     def copy(self) -> CardGroup:
-        return self.__class__([card.copy() for card in self.cards])
+        group = self.__class__.__new__(self.__class__)
+        group.counts = self.counts[:]
+        group.size = self.size
+        group._fingerprint = self._fingerprint
+        group.journal = None
+        group.watch = self.watch
+        group.pending = self.pending
+        return group
 
 
 class Hand(CardGroup):
@@ -93,20 +330,157 @@ class Hand(CardGroup):
 
 
 class Deck(CardGroup):
+    """
+    The deck also keeps its cards in order, since that decides future draws.
+    The order is a list plus a cursor at the top card, so drawing and milling
+    only move the cursor. The list is never changed in place: copies share it,
+    and anything other than taking from the top builds a new one.
+
+    The zone fingerprint only tracks the deck as a multiset. Cards always
+    leave the deck as the first copy from the top, so the order is fully
+    determined by the multiset plus the sequence the deck had the last time
+    it was shuffled or added to, which is what the order key hashes.
+    """
+
+    def __init__(self, cards: Iterable[Card] = ()):
+        self._cards = list(cards)
+        self._top = 0
+        super().__init__(self._cards)
+        self._order_key: Optional[int] = None
+        # while reads are recorded, the position of each card in the order the
+        # deck had then, -1 for cards added since, and how deep any copy of
+        # the deck has drawn into that order
+        self._positions: Optional[List[int]] = None
+        self._depth: Optional[List[int]] = None
+
     def __repr__(self) -> str:
-        return f"Deck containing {len(self.cards)} cards."
+        return f"Deck containing {self.size} cards."
+
+    @property
+    def cards(self) -> List[Card]:
+        return self._cards[self._top:]
+
+    @property
+    def fingerprint(self) -> int:
+        return self._fingerprint ^ self.order_key
+
+    @property
+    def contents_fingerprint(self) -> int:
+        """The fingerprint of the deck as a multiset, ignoring its order."""
+        return self._fingerprint
+
+    @property
+    def order_key(self) -> int:
+        if self._order_key is None:
+            self._order_key = 0
+            for position, card in enumerate(self.cards):
+                self._order_key ^= zobrist_key("order", position, card.id)
+        return self._order_key
+
+    def _set_order_key(self, order_key: Optional[int]) -> None:
+        if self.journal is not None:
+            self.journal.append((self._undo_order_key, self._order_key))
+        self._order_key = order_key
+
+    def _undo_order_key(self, order_key: Optional[int]) -> None:
+        self._order_key = order_key
+
+    def record_reads(self) -> List[int]:
+        """
+        Start recording how deep this deck and every copy made from now on
+        draw into its current order. The returned cell holds that depth; a
+        shuffle counts as reading the whole deck.
+        """
+        self._positions = list(range(-self._top, len(self._cards) - self._top))
+        self._depth = [0]
+        return self._depth
+
+    def _set_order(
+        self, cards: List[Card], positions: Optional[List[int]] = None
+    ) -> None:
+        if self.journal is not None:
+            self.journal.append(
+                (self._undo_order, (self._cards, self._top, self._positions))
+            )
+        self._cards = cards
+        self._top = 0
+        self._positions = positions
+
+    def _undo_order(self, order: Tuple[List[Card], int, Optional[List[int]]]) -> None:
+        self._cards, self._top, self._positions = order
+
+    def _undo_draw(self, card: Card) -> None:
+        self._top -= 1
+        self._count_in(card)
 
     def shuffle(self) -> None:
-        random.shuffle(self.cards)
+        cards = self.cards
+        random.shuffle(cards)
+        if self._positions is not None:
+            deepest = max(self._positions[self._top:], default=-1)
+            self._depth[0] = max(self._depth[0], deepest + 1)
+        self._set_order(cards)
+        self._set_order_key(None)
 
     def draw(self) -> Card:
-        return self.cards.pop(0)
+        # settle the order key before the sequence it hashes changes
+        self.order_key
+        card = self._cards[self._top]
+        if self._positions is not None:
+            depth = self._positions[self._top] + 1
+            if depth > self._depth[0]:
+                self._depth[0] = depth
+        self._top += 1
+        self._count_out(card)
+        if self.journal is not None:
+            self.journal.append((self._undo_draw, card))
+        return card
+
+    def mill(self, count: int = 1) -> List[Card]:
+        """Take up to count cards off the top of the deck."""
+        return [self.draw() for _ in range(min(count, self.size))]
+
+    def remove(self, card) -> None:
+        if self.size and self._cards[self._top] == card:
+            self.draw()
+            return
+        self.order_key
+        index = self._cards.index(card, self._top)
+        positions = self._positions
+        if positions is not None:
+            positions = positions[self._top:index] + positions[index + 1:]
+        self._set_order(
+            self._cards[self._top:index] + self._cards[index + 1:], positions
+        )
+        super().remove(card)
+
+    def add(self, card) -> None:
+        positions = self._positions
+        if positions is not None:
+            positions = positions[self._top:] + [-1]
+        self._set_order(self.cards + [card], positions)
+        self._set_order_key(None)
+        super().add(card)
 
     def add_to_top(self, card: Card) -> None:
-        self.cards.insert(0, card)
+        positions = self._positions
+        if positions is not None:
+            positions = [-1] + positions[self._top:]
+        self._set_order([card] + self.cards, positions)
+        self._set_order_key(None)
+        super().add(card)
 
     def add_to_bottom(self, card: Card) -> None:
-        self.cards.append(card)
+        self.add(card)
+
+    def copy(self) -> Deck:
+        group = super().copy()
+        group._cards = self._cards
+        group._top = self._top
+        group._order_key = self.order_key
+        group._positions = self._positions
+        group._depth = self._depth
+        return group
 
 
 class Grave(CardGroup):
@@ -122,20 +496,52 @@ class Banished(CardGroup):
 
 
 @dataclass
-class Game:
+class Game(PendingTriggers):
     hand: Hand
     deck: Deck
     grave: Grave
     monsters: Field
     backrow: Field
     banished: Banished
-    flags: Set[str]
+    # bitmask of FLAGS, use flag_names() to list them
+    flags: int
     disruptions: List[Disruption]
+    flag_fingerprint: Optional[int] = field(default=None, repr=False, compare=False)
+    journal: Optional[list] = field(default=None, repr=False, compare=False)
+    # the probability of the opening hand this game came from, relative to
+    # the other games it is reported with, see Manager.opening_hands
+    weight: float = field(default=1.0, repr=False, compare=False)
+    # hopt bit to the bitmask of triggers spending it sets off, and the
+    # triggers set off since postprocess last looked, see Manager.watch
+    watch: Optional[Dict[int, int]] = field(default=None, repr=False, compare=False)
+    pending: int = field(default=0, repr=False, compare=False)
+
+    def __post_init__(self) -> None:
+        if self.flag_fingerprint is None:
+            self.flag_fingerprint = FLAGS.fingerprint(self.flags)
+
+    def __getstate__(self) -> Dict:
+        # bits are assigned in the order flags are first used, which differs
+        # between processes, so flags are pickled by name
+        state = self.__dict__.copy()
+        state["flags"] = self.flag_names()
+        state["journal"] = None
+        # watched by bit too, and watched again when a search starts
+        state["watch"] = None
+        state["pending"] = 0
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.flags = 0
+        for name in state["flags"]:
+            self.flags |= FLAGS.named(name)
+        self.flag_fingerprint = FLAGS.fingerprint(self.flags)
 
     @classmethod
     def build_from_recipe(cls, deck_recipe: Tuple[Tuple[Card, int]]) -> Game:
         game = cls(
-            Hand([]), Deck([]), Grave([]), Field([]), Field([]), Banished([]), set(), []
+            Hand([]), Deck([]), Grave([]), Field([]), Field([]), Banished([]), 0, []
         )
         for (card, count) in deck_recipe:
             for _ in range(count):
@@ -146,29 +552,58 @@ class Game:
         return game
 
     def __eq__(self, other) -> bool:
-        return (
-            (self.hand == other.hand)
-            and (self.deck == other.deck)
-            and (self.grave == other.grave)
-            and (self.monsters == other.monsters)
-            and (self.backrow == other.backrow)
-            and (self.banished == other.banished)
-            and (self.flags == other.flags)
-            and (self.disruptions == other.disruptions)
-        )
+        return self.fingerprint == other.fingerprint
 
     def __hash__(self) -> int:
-        return hash(
-            (
-                self.hand,
-                self.deck,
-                self.grave,
-                self.monsters,
-                self.backrow,
-                self.banished,
-                self.flags,
-                self.disruptions,
+        return self.fingerprint
+
+    @property
+    def fingerprint(self) -> int:
+        """64 bit Zobrist hash of the whole state, kept up to date by the zones."""
+        return self.flag_fingerprint ^ self.board_fingerprint
+
+    @property
+    def board_fingerprint(self) -> int:
+        """The fingerprint of the zones and disruptions alone, without flags."""
+        value = 0
+        for zone, multiplier in zip(self.zones, ZONE_MULTIPLIERS):
+            value ^= (zone.fingerprint * multiplier) & FINGERPRINT_MASK
+        for index, disruption in enumerate(self.disruptions):
+            value ^= zobrist_key(
+                "disruption", index, disruption.name, disruption.point_value
             )
+        return value
+
+    @property
+    def contents_fingerprint(self) -> int:
+        """
+        The fingerprint without the order of the deck, for what only depends
+        on which cards are where, like endphase.
+        """
+        # the deck is the second zone
+        multiplier = ZONE_MULTIPLIERS[1]
+        return (
+            self.fingerprint
+            ^ (self.deck.fingerprint * multiplier) & FINGERPRINT_MASK
+            ^ (self.deck.contents_fingerprint * multiplier) & FINGERPRINT_MASK
+        )
+
+    def canonical_key(self) -> Tuple:
+        """
+        The state by card and flag names, without the order of the deck.
+        Unlike the fingerprints it does not depend on card ids, so it is the
+        same in every process whatever order the managers were imported in.
+        """
+        return (
+            tuple(
+                tuple(sorted(Counter(card.name for card in zone.cards).items()))
+                for zone in self.zones
+            ),
+            tuple(sorted(self.flag_names())),
+            tuple(
+                (disruption.name, disruption.point_value)
+                for disruption in self.disruptions
+            ),
         )
 
     def __repr__(self) -> str:
@@ -190,19 +625,46 @@ class Game:
             self.monsters.copy(),
             self.backrow.copy(),
             self.banished.copy(),
-            self.flags.copy(),
+            self.flags,
             self.disruptions.copy(),
+            self.flag_fingerprint,
+            weight=self.weight,
+            watch=self.watch,
+            pending=self.pending,
         )
 
+    @property
+    def zones(self) -> Tuple[CardGroup, ...]:
+        return (
+            self.hand,
+            self.deck,
+            self.grave,
+            self.monsters,
+            self.backrow,
+            self.banished,
+        )
+
+    def track_changes(self) -> None:
+        """Record an undo log so that checkpoints can be rolled back."""
+        self.journal = []
+        for zone in self.zones:
+            zone.journal = self.journal
+
+    def checkpoint(self) -> Tuple[int, int]:
+        return len(self.journal), len(self.disruptions)
+
+    def rollback(self, checkpoint: Tuple[int, int]) -> None:
+        length, disruptions = checkpoint
+        while len(self.journal) > length:
+            undo, entry = self.journal.pop()
+            undo(entry)
+        # endphase appends disruptions directly
+        del self.disruptions[disruptions:]
+
     def reset(self) -> None:
-        while self.hand:
-            self.deck.add(self.hand.cards.pop())
-        while self.monsters:
-            self.deck.add(self.monsters.cards.pop())
-        while self.backrow:
-            self.deck.add(self.backrow.cards.pop())
-        while self.banished:
-            self.deck.add(self.banished.cards.pop())
+        for zone in (self.hand, self.monsters, self.backrow, self.banished):
+            for card in zone.cards:
+                self.move(zone, self.deck, card)
         self.deck.shuffle()
         for _ in range(5):
             self.draw()
@@ -212,29 +674,46 @@ class Game:
         dest.add(card)
 
     def resource_available(self, resource: str) -> bool:
-        return f"used:{resource}" not in self.flags
+        return not self.flags & FLAGS.resource(resource)
 
     def use_resource(self, resource: str) -> None:
-        self.flags.add(f"used:{resource}")
+        self._set_flag(FLAGS.resource(resource))
 
     def hopt_available(self, card: Card, tag: Optional[str] = "*") -> bool:
         if not tag:
-            return not any(
-                [flag.startswith(f"hopt-{card.name}") for flag in self.flags]
-            )
-        return f"hopt-{card.name}-{tag}" not in self.flags
+            return not self.flags & FLAGS.card_mask(card)
+        return not self.flags & FLAGS.hopt(card, tag)
 
     def use_hopt(self, card: Card, tag: str = "*") -> None:
-        self.flags.add(f"hopt-{card.name}-{tag}")
+        self._set_flag(FLAGS.hopt(card, tag))
 
     def add_flag(self, flag: str) -> None:
-        self.flags.add(flag)
+        self._set_flag(FLAGS.named(flag))
+
+    def _set_flag(self, bit: int) -> None:
+        if not self.flags & bit:
+            self.flags |= bit
+            self.flag_fingerprint ^= FLAGS.key(bit)
+            if self.journal is not None:
+                self.journal.append((self._undo_flag, bit))
+            if self.watch is not None:
+                triggers = self.watch.get(bit)
+                if triggers:
+                    self._set_pending(self.pending | triggers)
+
+    def _undo_flag(self, bit: int) -> None:
+        self.flags ^= bit
+        self.flag_fingerprint ^= FLAGS.key(bit)
 
     def has_flag(self, flag: str) -> bool:
-        return flag in self.flags
+        bit = FLAGS.bits.get(flag)
+        return bool(bit and self.flags & bit)
+
+    def flag_names(self) -> List[str]:
+        return FLAGS.to_names(self.flags)
 
     def draw(self) -> None:
-        self.hand.add(self.deck.cards.pop(0))
+        self.hand.add(self.deck.draw())
 
     def disruption_report(self) -> str:
         return f"{self.value()} Points: {', '.join([repr(disruption) for disruption in self.disruptions])}"
@@ -243,15 +722,633 @@ class Game:
         return sum([disruption.point_value for disruption in self.disruptions])
 
 
+@dataclass(frozen=True)
+class Precondition:
+    """
+    Cheap checks that must hold for an action to fire. The search evaluates
+    them on the shared game before paying for a copy, so they must never be
+    stricter than the action itself.
+
+    needs lists cards that never come back once every copy has left the hand
+    and deck, so the action is dead for the rest of that line of play.
+    """
+
+    zones: Tuple[Tuple[str, Card], ...] = ()
+    hopts: Tuple[Tuple[Card, str], ...] = ()
+    resources: Tuple[str, ...] = ()
+    predicate: Optional[Callable[[Manager, Game], bool]] = None
+    needs: Tuple[Card, ...] = ()
+
+    def possible(self, decklist: DeckList) -> bool:
+        """Whether the decklist has every main deck card this action uses."""
+        available = {card for (card, count) in decklist if count}
+        return all(
+            card.card_type == "ED" or card in available
+            for card in [card for (_, card) in self.zones] + list(self.needs)
+        )
+
+    def dead(self, game: Game) -> bool:
+        return any(
+            card not in game.hand and card not in game.deck for card in self.needs
+        )
+
+    def __call__(self, manager: Manager, game: Game) -> bool:
+        for (zone, card) in self.zones:
+            if card not in getattr(game, zone):
+                return False
+        for (card, tag) in self.hopts:
+            if not game.hopt_available(card, tag):
+                return False
+        for resource in self.resources:
+            if not game.resource_available(resource):
+                return False
+        return self.predicate is None or self.predicate(manager, game)
+
+
+def requires(
+    hand: Iterable[Card] = (),
+    deck: Iterable[Card] = (),
+    grave: Iterable[Card] = (),
+    monsters: Iterable[Card] = (),
+    backrow: Iterable[Card] = (),
+    banished: Iterable[Card] = (),
+    hopt: Iterable[Union[Card, Tuple[Card, str]]] = (),
+    resource: Iterable[str] = (),
+    needs: Iterable[Card] = (),
+) -> Callable:
+    """
+    Declare the cards, hopts and resources an action needs, e.g.
+    @requires(hand=[servant], hopt=[servant]). Every condition must hold.
+    Cards listed in needs= let the search drop the action for good once they
+    have left the hand and deck.
+    """
+    zones = []
+    for (zone, cards) in (
+        ("hand", hand),
+        ("deck", deck),
+        ("grave", grave),
+        ("monsters", monsters),
+        ("backrow", backrow),
+        ("banished", banished),
+    ):
+        zones.extend((zone, card) for card in cards)
+    hopts = tuple(entry if isinstance(entry, tuple) else (entry, "*") for entry in hopt)
+    precondition = Precondition(tuple(zones), hopts, tuple(resource), needs=tuple(needs))
+
+    def decorator(func: Callable) -> Callable:
+        func.precondition = precondition
+        return func
+
+    return decorator
+
+
+def trigger(
+    hopt: Iterable[Union[Card, Tuple[Card, str]]] = (), **zones: Iterable[Card]
+) -> Callable:
+    """
+    Run a method from postprocess whenever one of the cards enters its zone
+    or one of the hopts is spent, e.g. @trigger(grave=[apkalone]). Handlers
+    run in the order they are defined and still check their own conditions,
+    since the event only says when to look. An event after its handler's
+    turn sets it off at the next postprocess.
+
+    A handler is never run on a hunch, so it has to watch every event that
+    can make its condition true: a card it needs arriving, or a hopt it
+    needs spent, as in @trigger(grave=[jet], hopt=[jet]). Conditions that
+    only ever turn false, like a hopt still being available, need no watch.
+    """
+    hopts = tuple(entry if isinstance(entry, tuple) else (entry, "*") for entry in hopt)
+    entries = frozenset(
+        [(zone, card) for (zone, cards) in zones.items() for card in cards]
+        + [("hopt", card) for (card, _) in hopts]
+    )
+
+    def decorator(func: Callable) -> Callable:
+        func.trigger = entries
+        func.trigger_hopts = hopts
+        return func
+
+    return decorator
+
+
+def priority(level: int) -> Callable:
+    """
+    Move ordering hint for branch-and-bound search, e.g. @priority(2) on an
+    action that usually leads to big end boards. Higher levels are tried first.
+    """
+
+    def decorator(func: Callable) -> Callable:
+        func.priority = level
+        return func
+
+    return decorator
+
+
+class BestLeaves:
+    """
+    The best end games of a search, reduced as they come in rather than
+    collected: the best one, and the k - 1 runners-up behind it for
+    diagnostics. Ties go to the higher canonical_key rather than the game
+    found first, so every exhaustive engine reports the same game, and so
+    does a HandCache hit, which may come from a different deck order.
+    """
+
+    def __init__(self, k: int = 1):
+        self.k = max(k, 1)
+        # min-heap of (value, canonical_key, game), so the worst game kept is
+        # on top; a game already kept is never offered twice, so games are
+        # never compared
+        self.heap: List[Tuple[int, Tuple, Game]] = []
+        self.kept: Set[Tuple] = set()
+        self.value: Optional[int] = None
+
+    def __len__(self) -> int:
+        return len(self.heap)
+
+    def wants(self, value: int) -> bool:
+        """Whether a game of this value may be kept, depending on ties."""
+        return len(self.heap) < self.k or value >= self.heap[0][0]
+
+    def offer(self, game: Game) -> None:
+        """Keep a copy of game if it ranks among the best k."""
+        value = game.value()
+        if not self.wants(value):
+            return
+        key = game.canonical_key()
+        if key in self.kept:
+            return
+        if len(self.heap) < self.k:
+            heapq.heappush(self.heap, (value, key, game.copy()))
+        elif (value, key) > self.heap[0][:2]:
+            entry = (value, key, game.copy())
+            self.kept.discard(heapq.heapreplace(self.heap, entry)[1])
+        else:
+            return
+        self.kept.add(key)
+        if self.value is None or value > self.value:
+            self.value = value
+
+    @property
+    def best(self) -> Optional[Game]:
+        return max(self.heap)[2] if self.heap else None
+
+    def ranked(self) -> List[Game]:
+        return [game for (_, _, game) in sorted(self.heap, reverse=True)]
+
+
+@dataclass
+class SearchStats:
+    """
+    Limits for a single search and what it actually used. A search stops
+    expanding states as soon as any limit is hit. max_states caps the states
+    held in the transposition table, as a proxy for memory.
+    """
+
+    max_nodes: Optional[int] = None
+    max_seconds: Optional[float] = None
+    max_states: Optional[int] = None
+    nodes: int = 0
+    states: int = 0
+    started: float = field(default_factory=time.perf_counter)
+    truncated: bool = False
+    dominated: int = 0
+    leaves: BestLeaves = field(default_factory=BestLeaves)
+
+    @property
+    def seconds(self) -> float:
+        return time.perf_counter() - self.started
+
+    def spend(self, states: int) -> bool:
+        """Count one expansion. False once the budget has run out."""
+        self.nodes += 1
+        self.states = states
+        if not self.truncated and (
+            (self.max_nodes is not None and self.nodes > self.max_nodes)
+            or (self.max_states is not None and states > self.max_states)
+            or (self.max_seconds is not None and self.seconds > self.max_seconds)
+        ):
+            self.truncated = True
+        return not self.truncated
+
+
+class DominanceIndex:
+    """
+    Every state admitted to a search so far, bucketed by the manager's
+    dominance_key, so a new state is only compared against the states it is
+    comparable with rather than the whole frontier and closed set.
+    """
+
+    def __init__(self, manager: Manager, stats: SearchStats):
+        self.manager = manager
+        self.stats = stats
+        self.buckets: Dict[Hashable, List[Tuple[int, ...]]] = {}
+
+    def admit(self, game: Game) -> bool:
+        """Record the state, or return False if a known state dominates it."""
+        key = self.manager.dominance_key(game)
+        if key is None:
+            return True
+        vector = self.manager.dominance_vector(game)
+        dominates = self.manager.dominates
+        bucket = self.buckets.setdefault(key, [])
+        if any(dominates(other, vector) for other in bucket):
+            self.stats.dominated += 1
+            return False
+        # anything this state dominates is dominated through it from now on
+        bucket[:] = [other for other in bucket if not dominates(vector, other)]
+        bucket.append(vector)
+        return True
+
+
+class TranspositionTable:
+    """
+    The fingerprint of every state a search has reached, so that a state
+    reached through different action orders is only expanded once.
+
+    Given a capacity, the oldest states are forgotten to make room, which
+    keeps memory flat at the price of expanding them again if they come up.
+    """
+
+    def __init__(
+        self,
+        dominance: Optional[DominanceIndex] = None,
+        capacity: Optional[int] = None,
+    ):
+        # a dict rather than a set, so that the oldest state comes first
+        self.seen: Dict[int, None] = {}
+        self.dominance = dominance
+        self.capacity = capacity
+
+    def __len__(self) -> int:
+        return len(self.seen)
+
+    def admit(self, game: Game) -> bool:
+        """Record the state and say whether it is new and undominated."""
+        fingerprint = game.fingerprint
+        if fingerprint in self.seen:
+            return False
+        if self.capacity is not None and len(self.seen) >= self.capacity:
+            del self.seen[next(iter(self.seen))]
+        self.seen[fingerprint] = None
+        return self.dominance is None or self.dominance.admit(game)
+
+
+class Cache:
+    """
+    A cache that drops its least recently used entries beyond size and
+    counts its hits and misses. A cache belongs to one manager and decklist.
+    """
+
+    def __init__(self, size: int):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}({len(self)}/{self.size} entries, "
+            f"{self.hits} hits, {self.misses} misses, {self.hit_rate:.1%} hit rate)"
+        )
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class EndphaseCache(Cache):
+    """
+    The value of every end game by contents_fingerprint, so that a leaf
+    whose value is already known and would not be kept skips endphase, also
+    across opening hands. Only suits an endphase that neither draws nor uses
+    randomness.
+    """
+
+    def __init__(self, size: int = 4096):
+        super().__init__(size)
+        self.values: OrderedDict[int, int] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def lookup(self, game: Game) -> Tuple[int, Optional[int]]:
+        """The key to store game's end value under, and the value if known."""
+        key = game.contents_fingerprint
+        value = self.values.get(key)
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.values.move_to_end(key)
+        return key, value
+
+    def store(self, key: int, value: int) -> None:
+        self.values[key] = value
+        if len(self.values) > self.size:
+            self.values.popitem(last=False)
+
+
+class HandCache(Cache):
+    """
+    The best end game of every opening hand searched so far. Other than the
+    cards it draws, a search only sees the deck as a multiset, so entries
+    are keyed by the start state without the deck order plus the prefix of
+    the deck the search drew from (see Deck.record_reads). Searches that use
+    randomness or run out of budget are not stored, and the run options
+    must stay the same.
+    """
+
+    def __init__(self, size: int = 1024):
+        super().__init__(size)
+        self.games: OrderedDict[Tuple[int, Tuple[int, ...]], Game] = OrderedDict()
+        # per start state, how many entries were stored at each prefix length
+        self.depths: Dict[int, Dict[int, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self.games)
+
+    def key(self, start: Game) -> int:
+        return start.contents_fingerprint
+
+    def lookup(self, start: Game) -> Optional[Game]:
+        """The best end game stored for start, if its deck begins the same."""
+        key = self.key(start)
+        depths = self.depths.get(key)
+        if depths:
+            order = start.deck.cards
+            for depth in depths:
+                entry = (key, tuple(card.id for card in order[:depth]))
+                game = self.games.get(entry)
+                if game is not None:
+                    self.hits += 1
+                    self.games.move_to_end(entry)
+                    return game
+        self.misses += 1
+        return None
+
+    def store(self, key: int, order: List[Card], depth: int, game: Game) -> None:
+        """Store the result of a search that drew depth cards into order."""
+        entry = (key, tuple(card.id for card in order[:depth]))
+        if entry in self.games:
+            self.games.move_to_end(entry)
+            return
+        self.games[entry] = game
+        depths = self.depths.setdefault(key, {})
+        depths[depth] = depths.get(depth, 0) + 1
+        if len(self.games) > self.size:
+            (key, prefix), _ = self.games.popitem(last=False)
+            depths = self.depths[key]
+            depths[len(prefix)] -= 1
+            if not depths[len(prefix)]:
+                del depths[len(prefix)]
+                if not depths:
+                    del self.depths[key]
+
+
+class SolveCache(Cache):
+    """
+    A HandCache kept in an SQLite file that later runs share. Entries are
+    keyed by manager class, run options and the start state by name, and
+    are dropped once the source of the manager's modules changes. Rows are
+    counted every size // 100 stores, so each process may run over size by
+    that much. Every worker process opens its own connection.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        manager_class: type,
+        options: Optional[Dict] = None,
+        size: int = 100_000,
+    ):
+        super().__init__(size)
+        self.path = path
+        self.manager = manager_class.__qualname__
+        self.code = hashlib.blake2b(
+            b"".join(
+                inspect.getsource(sys.modules[klass.__module__]).encode()
+                for klass in manager_class.__mro__
+                if issubclass(klass, Manager)
+            ),
+            digest_size=16,
+        ).hexdigest()
+        # caches only change how fast a run is, not what it returns
+        self.options = repr(
+            sorted(
+                (name, value)
+                for (name, value) in (options or {}).items()
+                if not name.endswith("_cache")
+            )
+        )
+        self.connection: Optional[sqlite3.Connection] = None
+        # stores since the rows were last counted
+        self.unchecked = 0
+
+    def __getstate__(self) -> Dict:
+        state = self.__dict__.copy()
+        state["connection"] = None
+        return state
+
+    def __len__(self) -> int:
+        connection = self.connect()
+        (count,) = connection.execute("SELECT count(*) FROM solves").fetchone()
+        return count
+
+    def connect(self) -> sqlite3.Connection:
+        if self.connection is None:
+            self.connection = sqlite3.connect(self.path, timeout=60)
+            self.connection.execute("PRAGMA journal_mode=WAL")
+            self.connection.execute("PRAGMA synchronous=NORMAL")
+            with self.connection:
+                self.connection.execute(
+                    "CREATE TABLE IF NOT EXISTS solves (manager TEXT, code TEXT, "
+                    "options TEXT, state TEXT, prefix TEXT, game BLOB, used REAL, "
+                    "PRIMARY KEY (manager, options, state, prefix))"
+                )
+                self.connection.execute(
+                    "CREATE INDEX IF NOT EXISTS solves_used ON solves (used)"
+                )
+                self.connection.execute(
+                    "DELETE FROM solves WHERE manager = ? AND code != ?",
+                    (self.manager, self.code),
+                )
+                self.evict(self.connection)
+        return self.connection
+
+    def key(self, start: Game) -> str:
+        """A digest of start's canonical_key."""
+        key = repr(start.canonical_key()).encode()
+        return hashlib.blake2b(key, digest_size=16).hexdigest()
+
+    @staticmethod
+    def prefix(order: List[Card], depth: int) -> str:
+        return "\n".join(card.name for card in order[:depth])
+
+    def lookup(self, start: Game) -> Optional[Game]:
+        connection = self.connect()
+        entry = (self.manager, self.options, self.key(start))
+        rows = connection.execute(
+            "SELECT prefix, game FROM solves "
+            "WHERE manager = ? AND options = ? AND state = ?",
+            entry,
+        ).fetchall()
+        order = start.deck.cards
+        for (prefix, game) in rows:
+            depth = prefix.count("\n") + 1 if prefix else 0
+            if prefix == self.prefix(order, depth):
+                self.hits += 1
+                with connection:
+                    connection.execute(
+                        "UPDATE solves SET used = ? WHERE manager = ? AND "
+                        "options = ? AND state = ? AND prefix = ?",
+                        (time.time(),) + entry + (prefix,),
+                    )
+                return pickle.loads(game)
+        self.misses += 1
+        return None
+
+    def store(self, key: str, order: List[Card], depth: int, game: Game) -> None:
+        connection = self.connect()
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO solves VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    self.manager,
+                    self.code,
+                    self.options,
+                    key,
+                    self.prefix(order, depth),
+                    pickle.dumps(game),
+                    time.time(),
+                ),
+            )
+            self.unchecked += 1
+            if self.unchecked >= self.size // 100:
+                self.evict(connection)
+
+    def evict(self, connection: sqlite3.Connection) -> None:
+        self.unchecked = 0
+        (count,) = connection.execute("SELECT count(*) FROM solves").fetchone()
+        if count > self.size:
+            connection.execute(
+                "DELETE FROM solves WHERE rowid IN "
+                "(SELECT rowid FROM solves ORDER BY used LIMIT ?)",
+                (count - self.size,),
+            )
+
+
+class Percentage(str):
+    """
+    A share of end games as generate_stats reports it, e.g. "72.0%", that
+    also keeps the fraction and the effective sample size behind it, so the
+    confidence interval can be reported or checked.
+    """
+
+    fraction: float
+    samples: float
+
+    def __new__(cls, fraction: float, samples: float) -> Percentage:
+        percentage = super().__new__(cls, f"{100 * fraction:.1f}%")
+        percentage.fraction = fraction
+        percentage.samples = samples
+        return percentage
+
+    def __reduce__(self) -> Tuple:
+        return (self.__class__, (self.fraction, self.samples))
+
+    def half_width(self, z: float = 1.96) -> float:
+        """
+        Half the width of the Wilson score interval, in percentage points.
+        The default z is for 95% confidence. Unlike the normal approximation
+        it stays wide for shares near 0% or 100% measured on few samples.
+        """
+        if not self.samples:
+            return 100.0
+        p, n = self.fraction, self.samples
+        return (
+            100
+            * z
+            * math.sqrt(p * (1 - p) / n + z * z / (4 * n * n))
+            / (1 + z * z / n)
+        )
+
+    def with_interval(self, z: float = 1.96) -> str:
+        return f"{self} ± {self.half_width(z):.1f}%"
+
+
+def meets_goal(
+    game: Game, goal: Optional[Callable[[Game], bool]], threshold: int
+) -> bool:
+    return game.value() >= threshold and (goal is None or goal(game))
+
+
 class Manager:
     default_decklist = tuple()
 
+    # Built once per subclass when it is defined. Actions are plain functions
+    # called as action(manager, game); their index in the tuple is stable, so
+    # it can stand in for the action in traces and caches.
+    cards: Tuple[Card, ...] = ()
+    actions: Tuple[Callable[[Manager, Game], Optional[Game]], ...] = ()
+    action_names: Tuple[str, ...] = ()
+    action_index: Dict[str, int] = {}
+    guards: Tuple[Optional[Precondition], ...] = ()
+    priorities: Tuple[int, ...] = ()
+    # @trigger handlers in definition order, the zones each one watches, and
+    # per zone the bitmask of handlers each card's arrival sets off
+    triggers: Tuple[Callable[[Manager, Game], None], ...] = ()
+    trigger_zones: Tuple[Tuple[str, ...], ...] = ()
+    watches: Dict[str, Dict[int, int]] = {}
+    # per hopt bit, the bitmask of handlers spending it sets off
+    hopt_watch: Dict[int, int] = {}
+    endphase_cache: Optional[EndphaseCache] = None
+    # cards grouped by the part they play in a hand, e.g. starters; stratified
+    # sampling deals hands by how many cards of each category they hold
+    categories: Dict[str, Tuple[Card, ...]] = {}
+    # cards that only ever count as disruptions, never as combo pieces, so
+    # holding more of them is never worse, see dominance_key
+    spare_cards: Tuple[Card, ...] = ()
+
+    def __init_subclass__(cls, **kwargs) -> None:
+        super().__init_subclass__(**kwargs)
+        cls.cards = tuple(
+            value for value in vars(cls).values() if isinstance(value, Card)
+        )
+        for card in cls.cards:
+            FLAGS.hopt(card)
+
+        cls.actions = tuple(
+            getattr(cls, name)
+            for name in dir(cls)
+            if name.startswith("action") and callable(getattr(cls, name))
+        )
+        cls.action_names = tuple(action.__name__ for action in cls.actions)
+        cls.action_index = {name: index for (index, name) in enumerate(cls.action_names)}
+        cls.guards = tuple(cls.build_guard(action) for action in cls.actions)
+        cls.priorities = tuple(getattr(action, "priority", 0) for action in cls.actions)
+
+        handlers = {}
+        for klass in reversed(cls.__mro__):
+            for (name, value) in vars(klass).items():
+                if hasattr(value, "trigger"):
+                    handlers[name] = value
+        cls.triggers = tuple(handlers.values())
+        cls.trigger_zones = tuple(
+            tuple(sorted({zone for (zone, _) in handler.trigger if zone != "hopt"}))
+            for handler in cls.triggers
+        )
+        cls.watches = {}
+        cls.hopt_watch = {}
+        for (index, handler) in enumerate(cls.triggers):
+            for (zone, card) in handler.trigger:
+                if zone != "hopt":
+                    watch = cls.watches.setdefault(zone, {})
+                    watch[card.id] = watch.get(card.id, 0) | 1 << index
+            for (card, tag) in handler.trigger_hopts:
+                bit = FLAGS.hopt(card, tag)
+                cls.hopt_watch[bit] = cls.hopt_watch.get(bit, 0) | 1 << index
+
     def __init__(self, decklist: Optional[DeckList] = None):
-        self.func_list = [
-            getattr(self.__class__, func)
-            for func in dir(self.__class__)
-            if callable(getattr(self.__class__, func)) and func.startswith("action")
-        ]
 
         if decklist:
             self.decklist = decklist
@@ -259,43 +1356,579 @@ class Manager:
             self.decklist = self.default_decklist
 
         self.initial_game = Game.build_from_recipe(self.decklist)
+        self.stats = SearchStats()
+
+        # actions that can never fire with this decklist are left out of the
+        # search entirely
+        self.live_actions = tuple(
+            index
+            for (index, guard) in enumerate(self.guards)
+            if not guard or guard.possible(self.decklist)
+        )
+        # the same actions, most promising first, for branch-and-bound
+        self.ordered_actions = tuple(
+            sorted(self.live_actions, key=lambda index: -self.priorities[index])
+        )
+
+    @classmethod
+    def build_guard(cls, func: Callable) -> Optional[Precondition]:
+        """
+        Combine an action's @requires declaration with an optional
+        can_<action> method, e.g. can_summon_gizmek for action_summon_gizmek.
+        """
+        precondition = getattr(func, "precondition", None)
+        predicate = getattr(cls, "can_" + func.__name__[len("action_"):], None)
+        if predicate:
+            precondition = replace(precondition or Precondition(), predicate=predicate)
+        return precondition
+
+    def prune(self, live: Tuple[int, ...], game: Game) -> Tuple[int, ...]:
+        """Drop the actions whose needed cards have left the hand and deck."""
+        guards = self.guards
+        return tuple(
+            index
+            for index in live
+            if not (guards[index] and guards[index].needs and guards[index].dead(game))
+        )
+
+    def upper_bound(self, game: Game) -> Optional[int]:
+        """
+        Optimistic bound on the value of any end game reachable from this
+        state. Branch-and-bound cuts every subtree whose bound cannot beat the
+        best game found so far, so it must never underestimate. None means
+        no bound is known and nothing is cut.
+        """
+        return None
+
+    def dominance_key(self, game: Game) -> Optional[Hashable]:
+        """
+        States are only ever compared for dominance when their keys match.
+        By default that is when everything but the spare cards in hand and
+        the hopts and resources spent matches. None leaves the state out of
+        dominance pruning, as does a manager without spare_cards.
+        """
+        if not self.spare_cards:
+            return None
+        # the spare copies sit in the deck, so while it is still drawn from
+        # its order has to match as well
+        return (
+            tuple(card.id for card in game.hand if card not in self.spare_cards),
+            game.deck.fingerprint if self.deck_in_play(game) else None,
+            game.grave.fingerprint,
+            game.monsters.fingerprint,
+            game.backrow.fingerprint,
+            game.banished.fingerprint,
+            tuple(map(repr, game.disruptions)),
+            game.flags & ~FLAGS.usage,
+        )
+
+    def deck_in_play(self, game: Game) -> bool:
+        """Whether cards can still be drawn or milled, so the deck order counts."""
+        return True
+
+    def dominance_vector(self, game: Game) -> Tuple[int, ...]:
+        return (game.flags,) + tuple(game.hand.count(card) for card in self.spare_cards)
+
+    def dominates(self, vector: Tuple[int, ...], other: Tuple[int, ...]) -> bool:
+        """
+        Whether a state summarised by vector can always do at least as well
+        as one summarised by other: spending only some of the same hopts and
+        resources, or holding more spare cards, is never worse.
+        """
+        return vector[0] & ~other[0] == 0 and all(
+            mine >= theirs for (mine, theirs) in zip(vector[1:], other[1:])
+        )
+
+    def watch(self, game: Game) -> None:
+        """
+        Have game's zones record the cards arriving that set off triggers,
+        and game the hopts spent, with every trigger pending to begin with,
+        since postprocess has not looked at the game yet.
+        """
+        for (source, watch) in [(game, self.hopt_watch)] + [
+            (getattr(game, zone), watch) for (zone, watch) in self.watches.items()
+        ]:
+            source.watch = watch or None
+            source.pending = 0
+            for triggers in watch.values():
+                source.pending |= triggers
 
     def postprocess(self, game: Game) -> Game:
+        """Run the @trigger handlers that cards arriving or hopts spent set off."""
+        pending = game.pending
+        for zone in self.watches:
+            pending |= getattr(game, zone).pending
+        if not pending:
+            return game
+        for (index, handler) in enumerate(self.triggers):
+            bit = 1 << index
+            fired = game.take_pending(bit)
+            for zone in self.trigger_zones[index]:
+                fired |= getattr(game, zone).take_pending(bit)
+            if fired:
+                handler(self, game)
         return game
 
     def endphase(self, game: Game) -> Game:
         return game
 
     @classmethod
-    def percent_with_flags(cls, end_games: List[Game], flags: List[str]) -> str:
-        percentage = sum(
-            1 for game in end_games if all(game.has_flag(flag) for flag in flags)
-        ) / float(len(end_games) / 100)
-        return f"{percentage:.1f}%"
+    def percent_with_flags(cls, end_games: List[Game], flags: List[str]) -> Percentage:
+        """
+        The share of end_games with every flag, by weight. Unequal weights
+        count as fewer samples, by Kish's effective sample size.
+        """
+        total = sum(game.weight for game in end_games)
+        matching = sum(
+            game.weight
+            for game in end_games
+            if all(game.has_flag(flag) for flag in flags)
+        )
+        samples = total * total / sum(game.weight ** 2 for game in end_games)
+        return Percentage(matching / total, samples)
 
     @classmethod
     def generate_stats(cls, end_games: List[Game]) -> List[List[str]]:
         return []
 
-    def run(self) -> Game:
+    def heuristic(self, game: Game) -> int:
+        """
+        How promising a state looks to best-first and beam search, higher is
+        better. Defaults to the value of ending the turn right there.
+        """
+        return self.end_value(game)
+
+    def end_value(self, game: Game) -> int:
+        """The value of ending the turn in game, which is left as it is."""
+        if self.endphase_cache is None:
+            return self.endphase(game.copy()).value()
+        key, value = self.endphase_cache.lookup(game)
+        if value is None:
+            value = self.endphase(game.copy()).value()
+            self.endphase_cache.store(key, value)
+        return value
+
+    def reduce_leaf(
+        self,
+        game: Game,
+        goal: Optional[Callable[[Game], bool]],
+        leaves: BestLeaves,
+    ) -> Optional[Game]:
+        """
+        Run endphase on a leaf of the search, which may change game, and offer
+        a copy of the end game to leaves, or return it if it meets goal.
+        """
+        cache = self.endphase_cache
+        key = None
+        if cache is not None and goal is None:
+            key, value = cache.lookup(game)
+            if value is not None and not leaves.wants(value):
+                return None
+
+        end_game = self.endphase(game)
+        if key is not None:
+            cache.store(key, end_game.value())
+        if goal and goal(end_game):
+            return end_game.copy()
+        leaves.offer(end_game)
+        return None
+
+    def deal(self) -> Game:
+        """A fresh opening hand, ready to be passed to run(start=...)."""
         start = self.initial_game.copy()
         start.reset()
-        state_queue = [(start, 0)]
-        end_games = [self.initial_game.copy()]
+        return start
+
+    def opening_hands(self) -> Iterator[Game]:
+        """
+        Every distinct opening hand once, weighted by its probability, ready
+        to be passed to run(start=...). The rest of the deck is shuffled, so
+        what the hand draws into is still sampled.
+        """
+        decklist = [(card, count) for (card, count) in self.decklist if count]
+        total = math.comb(sum(count for (_, count) in decklist), 5)
+
+        def hands(index: int, size: int) -> Iterator[Tuple[List[Card], int]]:
+            if not size:
+                yield [], 1
+                return
+            if index == len(decklist):
+                return
+            card, count = decklist[index]
+            for copies in range(min(count, size) + 1):
+                for (rest, ways) in hands(index + 1, size - copies):
+                    yield [card] * copies + rest, math.comb(count, copies) * ways
+
+        for (cards, ways) in hands(0, 5):
+            start = self.deal_hand(cards)
+            start.weight = ways / total
+            yield start
+
+    def deal_hand(self, cards: List[Card]) -> Game:
+        """The opening hand of the given cards, with the rest of the deck shuffled."""
+        start = self.initial_game.copy()
+        for card in start.hand.cards:
+            start.move(start.hand, start.deck, card)
+        for card in cards:
+            start.move(start.deck, start.hand, card)
+        start.deck.shuffle()
+        return start
+
+    def category_copies(self) -> List[List[Card]]:
+        """
+        Every copy in the decklist of the cards of each category, then of the
+        cards in none. A card in several categories counts for the first.
+        """
+        copies = [[] for _ in range(len(self.categories) + 1)]
+        for (card, count) in self.decklist:
+            index = next(
+                (
+                    index
+                    for (index, cards) in enumerate(self.categories.values())
+                    if card in cards
+                ),
+                len(self.categories),
+            )
+            copies[index].extend([card] * count)
+        return copies
+
+    def strata(self) -> Dict[Tuple[int, ...], float]:
+        """
+        The probability of every stratum of opening hands, which is how many
+        cards of each category the hand holds.
+        """
+        copies = self.category_copies()
+        total = math.comb(sum(len(cards) for cards in copies), 5)
+        strata = {}
+        for stratum in itertools.product(
+            *(range(min(len(cards), 5) + 1) for cards in copies[:-1])
+        ):
+            rest = 5 - sum(stratum)
+            if 0 <= rest <= len(copies[-1]):
+                ways = math.comb(len(copies[-1]), rest)
+                for (cards, count) in zip(copies, stratum):
+                    ways *= math.comb(len(cards), count)
+                strata[stratum] = ways / total
+        return strata
+
+    def stratified_hands(self, count: int) -> List[Game]:
+        """
+        About count random opening hands, ready to be passed to
+        run(start=...), dealt in proportion to the probability of each
+        stratum and at least one per stratum. Each is weighted so that the
+        weights of a stratum add up to its share of count, which makes
+        batches of any size combine.
+        """
+        copies = self.category_copies()
+        hands = []
+        for (stratum, probability) in self.strata().items():
+            size = max(1, round(count * probability))
+            for _ in range(size):
+                cards = []
+                for (pool, drawn) in zip(copies, stratum + (5 - sum(stratum),)):
+                    cards.extend(random.sample(pool, drawn))
+                start = self.deal_hand(cards)
+                start.weight = count * probability / size
+                hands.append(start)
+        return hands
+
+    def run(
+        self,
+        # "dfs" and "bfs" are exhaustive, "best" expands the state with the
+        # best heuristic() first, "beam" keeps the beam_width best states of
+        # each depth and may miss the best line
+        strategy: str = "dfs",
+        # skip subtrees whose upper_bound() cannot beat the best game so far
+        bound: bool = False,
+        # stop at the first end game meeting goal and/or threshold and return
+        # it with GOAL_FLAG set
+        goal: Optional[Callable[[Game], bool]] = None,
+        threshold: Optional[int] = None,
+        beam_width: int = 8,
+        # a fresh opening hand if not given
+        start: Optional[Game] = None,
+        # budgets; the best game so far is returned with TRUNCATED_FLAG set
+        max_nodes: Optional[int] = None,
+        max_seconds: Optional[float] = None,
+        max_states: Optional[int] = None,
+        # also drop states dominated by one already seen, see dominance_key
+        dominance: bool = False,
+        # states kept in the transposition table; unlike max_states, a full
+        # table forgets old states rather than ending the search
+        table_size: Optional[int] = None,
+        # the runners-up kept in self.stats.leaves, for diagnostics
+        top_k: int = 1,
+        # share these across runs to skip repeated endphases and hands
+        endphase_cache: Optional[EndphaseCache] = None,
+        hand_cache: Optional[Union[HandCache, SolveCache]] = None,
+    ) -> Game:
+        """
+        Search the lines of play from start and return the best end game.
+        self.stats records what the search used.
+        """
+        if start is None:
+            start = self.deal()
+        self.endphase_cache = endphase_cache
+
+        if threshold is not None:
+            goal = partial(meets_goal, goal=goal, threshold=threshold)
+
+        stats = self.stats = SearchStats(
+            max_nodes, max_seconds, max_states, leaves=BestLeaves(top_k)
+        )
+        if hand_cache is not None:
+            cached = hand_cache.lookup(start)
+            if cached is not None:
+                cached = cached.copy()
+                cached.weight = start.weight
+                stats.leaves.offer(cached)
+                return cached
+            key, order = hand_cache.key(start), start.deck.cards
+            depth = start.deck.record_reads()
+            random_state = random.getstate()
+
+        table = TranspositionTable(
+            DominanceIndex(self, stats) if dominance else None, table_size
+        )
+        if strategy == "bfs":
+            best = self.run_breadth_first(start, bound, goal, stats, table)
+        elif strategy == "dfs":
+            best = self.run_depth_first(start, bound, goal, stats, table)
+        elif strategy == "best":
+            best = self.run_best_first(start, bound, goal, stats, table)
+        elif strategy == "beam":
+            best = self.run_beam(start, beam_width, bound, goal, stats, table)
+        else:
+            raise ValueError(f"Unknown search strategy {strategy!r}")
+
+        if (
+            hand_cache is not None
+            and not stats.truncated
+            and random.getstate() == random_state
+        ):
+            hand_cache.store(key, order, depth[0], best.copy())
+        return best
+
+    def expand(
+        self,
+        game: Game,
+        live: Tuple[int, ...],
+        table: TranspositionTable,
+    ) -> Iterator[Tuple[Game, Tuple[int, ...]]]:
+        """Yield every new, undominated state one action away, with its live actions."""
+        for index in live:
+            guard = self.guards[index]
+            if guard and not guard(self, game):
+                continue
+            child = self.actions[index](self, game.copy())
+            if child:
+                child = self.postprocess(child)
+                if table.admit(child):
+                    yield child, self.prune(live, child)
+
+    def hopeless(self, game: Game, best_value: Optional[int]) -> bool:
+        if best_value is None:
+            return False
+        upper_bound = self.upper_bound(game)
+        return upper_bound is not None and upper_bound <= best_value
+
+    def run_breadth_first(
+        self,
+        start: Game,
+        bound: bool = False,
+        goal: Optional[Callable[[Game], bool]] = None,
+        stats: Optional[SearchStats] = None,
+        table: Optional[TranspositionTable] = None,
+    ) -> Game:
+        stats = stats or SearchStats()
+        if table is None:
+            table = TranspositionTable()
+        self.watch(start)
+        table.admit(start)
+        actions = self.ordered_actions if bound else self.live_actions
+        state_queue = [(start, 0, self.prune(actions, start))]
+        leaves = stats.leaves
 
         while state_queue:
-            game, next_action = state_queue.pop(0)
-
-            if next_action == len(self.func_list):
-                end_games.append(self.endphase(game))
+            game, position, live = state_queue.pop(0)
+
+            out_of_budget = position == 0 and not stats.spend(len(table))
+            if position == len(live) or out_of_budget:
+                reached = self.reduce_leaf(game, goal, leaves)
+                if reached:
+                    reached.add_flag(GOAL_FLAG)
+                    return reached
+                if out_of_budget:
+                    break
                 continue
 
-            new_game = self.func_list[next_action](self, game.copy())
-
-            if new_game:
-                new_game = self.postprocess(new_game)
-                state_queue.append((new_game, 0))
+            if position == 0 and bound and self.hopeless(game, leaves.value):
+                continue
 
-            state_queue.append((game, next_action + 1))
+            next_action = live[position]
+            guard = self.guards[next_action]
+            # only pay for a copy when the action's cheap checks pass
+            if not guard or guard(self, game):
+                new_game = self.actions[next_action](self, game.copy())
+
+                if new_game:
+                    new_game = self.postprocess(new_game)
+                    if not (
+                        bound and self.hopeless(new_game, leaves.value)
+                    ) and table.admit(new_game):
+                        state_queue.append((new_game, 0, self.prune(live, new_game)))
+
+            state_queue.append((game, position + 1, live))
+
+        best = leaves.best
+        if stats.truncated:
+            best.add_flag(TRUNCATED_FLAG)
+        return best
+
+    def run_depth_first(
+        self,
+        start: Game,
+        bound: bool = False,
+        goal: Optional[Callable[[Game], bool]] = None,
+        stats: Optional[SearchStats] = None,
+        table: Optional[TranspositionTable] = None,
+    ) -> Game:
+        """
+        Make/unmake search over a single game. Actions and postprocess mutate
+        the game in place as usual, and every change they make is rolled back
+        from the game's undo log when the search backtracks, so only leaves
+        that improve on the best result so far are ever copied.
+        """
+        stats = stats or SearchStats()
+        if table is None:
+            table = TranspositionTable()
+        self.watch(start)
+        game = start
+        game.track_changes()
+        table.admit(game)
+        leaves = stats.leaves
+        reached: Optional[Game] = None
+
+        def visit(live: Tuple[int, ...]) -> bool:
+            """
+            Returns True once the goal is met or the budget has run out, to
+            unwind the whole search.
+            """
+            nonlocal reached
+            if bound and self.hopeless(game, leaves.value):
+                return False
+            if not stats.spend(len(table)):
+                # out of budget, so this state becomes a leaf
+                live = ()
+            for index in live:
+                guard = self.guards[index]
+                if guard and not guard(self, game):
+                    continue
+                checkpoint = game.checkpoint()
+                done = False
+                if self.actions[index](self, game):
+                    self.postprocess(game)
+                    if table.admit(game):
+                        done = visit(self.prune(live, game))
+                game.rollback(checkpoint)
+                if done:
+                    return True
+
+            checkpoint = game.checkpoint()
+            reached = self.reduce_leaf(game, goal, leaves)
+            game.rollback(checkpoint)
+            return reached is not None or stats.truncated
+
+        actions = self.ordered_actions if bound else self.live_actions
+        visit(self.prune(actions, game))
+        if reached is not None:
+            reached.add_flag(GOAL_FLAG)
+            return reached
+        best = leaves.best
+        if stats.truncated:
+            best.add_flag(TRUNCATED_FLAG)
+        return best
+
+    def run_best_first(
+        self,
+        start: Game,
+        bound: bool = False,
+        goal: Optional[Callable[[Game], bool]] = None,
+        stats: Optional[SearchStats] = None,
+        table: Optional[TranspositionTable] = None,
+    ) -> Game:
+        stats = stats or SearchStats()
+        if table is None:
+            table = TranspositionTable()
+        self.watch(start)
+        table.admit(start)
+        actions = self.ordered_actions if bound else self.live_actions
+        leaves = stats.leaves
+        # the counter breaks ties in heuristic first come, first served, and
+        # keeps games from ever being compared
+        counter = itertools.count()
+        live = self.prune(actions, start)
+        frontier = [(-self.heuristic(start), next(counter), start, live)]
+
+        while frontier:
+            _, _, game, live = heapq.heappop(frontier)
+            if bound and self.hopeless(game, leaves.value):
+                continue
 
-        return max(end_games, key=lambda game: game.value())
+            if stats.spend(len(table)):
+                for child, child_live in self.expand(game, live, table):
+                    heapq.heappush(
+                        frontier, (-self.heuristic(child), next(counter), child, child_live)
+                    )
+
+            reached = self.reduce_leaf(game, goal, leaves)
+            if reached:
+                reached.add_flag(GOAL_FLAG)
+                return reached
+            if stats.truncated:
+                break
+
+        best = leaves.best
+        if stats.truncated:
+            best.add_flag(TRUNCATED_FLAG)
+        return best
+
+    def run_beam(
+        self,
+        start: Game,
+        width: int,
+        bound: bool = False,
+        goal: Optional[Callable[[Game], bool]] = None,
+        stats: Optional[SearchStats] = None,
+        table: Optional[TranspositionTable] = None,
+    ) -> Game:
+        stats = stats or SearchStats()
+        if table is None:
+            table = TranspositionTable()
+        self.watch(start)
+        table.admit(start)
+        actions = self.ordered_actions if bound else self.live_actions
+        leaves = stats.leaves
+        beam = [(start, self.prune(actions, start))]
+
+        while beam:
+            layer = []
+            for game, live in beam:
+                if bound and self.hopeless(game, leaves.value):
+                    continue
+                if stats.spend(len(table)):
+                    layer.extend(self.expand(game, live, table))
+
+                reached = self.reduce_leaf(game, goal, leaves)
+                if reached:
+                    reached.add_flag(GOAL_FLAG)
+                    return reached
+
+            if stats.truncated:
+                break
+            beam = heapq.nlargest(width, layer, key=lambda entry: self.heuristic(entry[0]))
+
+        best = leaves.best
+        if stats.truncated:
+            best.add_flag(TRUNCATED_FLAG)
+        return best
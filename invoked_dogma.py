@@ -1,5 +1,7 @@
 from typing import List, Optional, Tuple, Dict
-from framework import Disruption, Manager, Card, Game
+from framework import (
+    Disruption, Manager, Card, Game, priority, requires, trigger
+)
 
 
 class InvokedDogmaManager(Manager):
@@ -56,6 +58,8 @@ class InvokedDogmaManager(Manager):
     hand_traps = (ash, ogre, veiler, imperm)
     going_second_cards = (ash, ogre, veiler, imperm, droplet, nibiru)
     backrow = (droplet, called, imperm, punishment)
+    spare_cards = (ash, ogre, veiler, imperm, droplet, called, punishment)
+    categories = {"starters": (aleister, meltdown, terraforming)}
 
     @classmethod
     def generate_stats(cls, end_games: List[Game]) -> List[List[str]]:
@@ -72,7 +76,9 @@ class InvokedDogmaManager(Manager):
     @classmethod
     def generate_sankey_data(
         cls, end_games: List[Game]
-    ) -> Tuple[List[str], List[str], List[int], List[int], List[int]]:
+    ) -> Tuple[List[str], List[str], List[int], List[int], List[float]]:
+        # flows are weighted like generate_stats, so exact and stratified runs
+        # keep their proportions
         results = [[0, 0, 0, 0], [0, 0, 0, 0], [0, 0, 0, 0]]
 
         for game in end_games:
@@ -95,7 +101,7 @@ class InvokedDogmaManager(Manager):
             if game.has_flag(">2 disruptions"):
                 inner_index += 1
 
-            results[outer_index][inner_index] += 1
+            results[outer_index][inner_index] += game.weight
 
         label = [
             "Pinpoint Landing Not Drawn",  # 0
@@ -114,7 +120,8 @@ class InvokedDogmaManager(Manager):
 
         return label, color, source, target, value
 
-    def postprocess(self, game: Game):
+    @trigger(grave=[apkalone])
+    def trigger_apkalone(self, game: Game) -> None:
         if self.apkalone in game.grave and game.hopt_available(self.apkalone):
             game.use_hopt(self.apkalone)
             if self.schism in game.deck:
@@ -122,15 +129,15 @@ class InvokedDogmaManager(Manager):
                 discard = self.select_schism_discard(game)
                 game.move(game.hand, game.grave, discard)
 
+    @trigger(grave=[construct])
+    def trigger_construct(self, game: Game) -> None:
         if self.construct in game.grave and game.hopt_available(self.construct):
             game.use_hopt(self.construct)
             if self.schism in game.grave:
                 game.move(game.grave, game.hand, self.schism)
 
-        return game
-
     def endphase(self, game: Game):
-        for card in game.hand:
+        for card in list(game.hand):
             if card in self.backrow:
                 game.move(game.hand, game.backrow, card)
 
@@ -172,7 +179,7 @@ class InvokedDogmaManager(Manager):
         pure_distruptions = 0
 
         if self.mechaba in game.monsters:
-            types_to_discard = set([card.card_type for card in game.hand])
+            types_to_discard = sorted(set([card.card_type for card in game.hand]))
             if types_to_discard:
                 game.add_flag("mechaba")
                 pure_distruptions += 1
@@ -214,6 +221,51 @@ class InvokedDogmaManager(Manager):
 
         return game
 
+    def can_still_draw(self, game: Game) -> bool:
+        return (
+            self.upstart in game.hand
+            or self.upstart in game.deck
+            or (
+                game.hopt_available(self.desires)
+                and (self.desires in game.hand or self.desires in game.deck)
+            )
+            or (
+                game.hopt_available(self.pinpoint)
+                and any(self.pinpoint in zone for zone in (game.hand, game.deck, game.backrow))
+            )
+        )
+
+    def upper_bound(self, game: Game) -> int:
+        drawing = self.can_still_draw(game)
+        bound = 0
+
+        if any(self.schism in zone for zone in (game.hand, game.deck, game.grave, game.backrow)):
+            bound += 3
+
+        # mechaba counts one disruption per card type left in hand
+        if self.mechaba in game.monsters or game.resource_available("extra deck"):
+            bound += 3
+
+        if self.fleur in game.hand or self.fleur in game.deck:
+            bound += 1
+
+        for card in self.hand_traps:
+            if card in game.hand or (drawing and card in game.deck):
+                bound += 1
+
+        for card in self.backrow:
+            if (
+                card in game.hand
+                or card in game.backrow
+                or (card in game.deck and (drawing or card == self.punishment))
+            ):
+                bound += 1
+
+        return bound
+
+    def deck_in_play(self, game: Game) -> bool:
+        return self.can_still_draw(game)
+
     def select_ecclesia_search_target(self, game: Game) -> Optional[Card]:
         if not game.hopt_available(self.titaniklad):
             # search during end phase
@@ -262,7 +314,7 @@ class InvokedDogmaManager(Manager):
             return self.schism
         else:
             # we dumped apkalone with maximus
-            options = [entry[0] for entry in self.deck_recipe]
+            options = [entry[0] for entry in self.decklist]
             if len(game.hand) > 1:
                 # keep schism if we can
                 options.remove(self.schism)
@@ -296,17 +348,20 @@ class InvokedDogmaManager(Manager):
         else:
             return (self.titaniklad, self.apkalone)
 
+    @requires(hand=[pinpoint], needs=[pinpoint])
     def action_activate_pinpoint(self, game: Game) -> Optional[Game]:
         if self.pinpoint not in game.backrow and self.pinpoint in game.hand:
             game.move(game.hand, game.backrow, self.pinpoint)
             return game
 
+    @requires(hand=[upstart], needs=[upstart])
     def action_use_upstart(self, game: Game) -> Optional[Game]:
         if self.upstart in game.hand and len(game.deck) > 1:
             game.move(game.hand, game.grave, self.upstart)
             game.draw()
             return game
 
+    @requires(hand=[desires], hopt=[desires], needs=[desires])
     def action_use_desires(self, game: Game) -> Optional[Game]:
         if (
             self.desires in game.hand
@@ -315,12 +370,17 @@ class InvokedDogmaManager(Manager):
         ):
             game.move(game.hand, game.grave, self.desires)
             game.use_hopt(self.desires)
-            for _ in range(10):
-                game.deck.cards.pop(0)
+            game.deck.mill(10)
             game.draw()
             game.draw()
             return game
 
+    @requires(
+        hand=[terraforming],
+        deck=[meltdown],
+        hopt=[terraforming],
+        needs=[terraforming, meltdown],
+    )
     def action_use_terraforming(self, game: Game) -> Optional[Game]:
         if (
             self.terraforming in game.hand
@@ -332,6 +392,7 @@ class InvokedDogmaManager(Manager):
             game.use_hopt(self.terraforming)
             return game
 
+    @requires(hand=[meltdown], hopt=[meltdown], needs=[meltdown])
     def action_use_meltdown(self, game: Game) -> Optional[Game]:
         if self.meltdown in game.hand and game.hopt_available(self.meltdown):
             game.move(game.hand, game.backrow, self.meltdown)
@@ -340,6 +401,7 @@ class InvokedDogmaManager(Manager):
                 game.move(game.deck, game.hand, self.aleister)
             return game
 
+    @requires(hand=[aleister], resource=["normal summon"])
     def action_summon_aleister(self, game: Game) -> Optional[Game]:
         if self.aleister in game.hand and game.resource_available("normal summon"):
             game.move(game.hand, game.monsters, self.aleister)
@@ -349,18 +411,22 @@ class InvokedDogmaManager(Manager):
                 game.use_hopt(self.aleister)
             return game
 
+    @requires(monsters=[aleister], resource=["extra deck"])
     def action_summon_almiraj(self, game: Game) -> Optional[Game]:
         if self.aleister in game.monsters and game.resource_available("extra deck"):
             game.move(game.monsters, game.grave, self.aleister)
             game.monsters.add(self.almiraj)
             return game
 
+    @requires(monsters=[almiraj], resource=["extra deck"])
     def action_summon_gardna(self, game: Game) -> Optional[Game]:
         if self.almiraj in game.monsters and game.resource_available("extra deck"):
             game.move(game.monsters, game.grave, self.almiraj)
             game.monsters.add(self.gardna)
             return game
 
+    @priority(1)
+    @requires(hand=[invocation], resource=["extra deck"])
     def action_summon_mechaba(self, game: Game) -> Optional[Game]:
         if self.invocation in game.hand and game.resource_available("extra deck"):
             if self.gardna in game.grave:
@@ -392,6 +458,7 @@ class InvokedDogmaManager(Manager):
             game.monsters.add(self.mechaba)
             return game
 
+    @requires(grave=[invocation], banished=[aleister])
     def action_recycle_aleister(self, game: Game) -> Optional[Game]:
         if self.invocation in game.grave and self.aleister in game.banished:
             game.move(game.grave, game.deck, self.invocation)
@@ -399,6 +466,8 @@ class InvokedDogmaManager(Manager):
             game.deck.shuffle()
             return game
 
+    @priority(1)
+    @requires(hand=[servant], hopt=[servant])
     def action_use_nadir(self, game: Game) -> Optional[Game]:
         if self.servant in game.hand and game.hopt_available(self.servant):
             search_target = self.select_nadir_search_target(game)
@@ -414,6 +483,7 @@ class InvokedDogmaManager(Manager):
             game.use_resource("extra deck")
             return game
 
+    @requires(hand=[ecclesia])
     def action_summon_ecclesia(self, game: Game) -> Optional[Game]:
         if self.ecclesia in game.hand:
             if any(
@@ -437,6 +507,8 @@ class InvokedDogmaManager(Manager):
                 game.use_resource("extra deck")
             return game
 
+    @priority(1)
+    @requires(hand=[maximus], hopt=[maximus])
     def action_summon_maximus(self, game: Game) -> Optional[Game]:
         if self.maximus in game.hand and game.hopt_available(self.maximus):
             banish = self.select_maximus_banish(game)
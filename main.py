@@ -9,7 +9,7 @@ from plotly import graph_objects
 from pytablewriter import MarkdownTableWriter
 from pytablewriter.style import Style
 
-from framework import DeckList, Game, Manager
+from framework import TRUNCATED_FLAG, DeckList, Game, Manager, Percentage, SolveCache
 from orcust import OrcustManager
 from invoked_dogma import InvokedDogmaManager
 from synchro_dogma import SynchroDogmaManager
@@ -34,7 +34,7 @@ def generate_sankey(
     color: List[str],
     source: List[int],
     target: List[int],
-    value: List[int],
+    value: List[float],
 ):
     fig = graph_objects.Figure(
         data=[
@@ -77,23 +77,100 @@ def generate_overall_table(name: str, headers: List[str], data: List[List[str]])
     return writer.dumps()
 
 
-def run_one(manager: Manager) -> Game:
-    return manager.run()
+# set once per worker process by the pool initializer, so the manager is
+# pickled once per worker rather than once per game
+worker_manager: Optional[Manager] = None
+worker_options: Dict = {}
+
+
+def init_worker(manager: Manager, options: Dict) -> None:
+    global worker_manager, worker_options
+    worker_manager = manager
+    worker_options = options
+
+
+def run_one(_: int) -> Game:
+    return worker_manager.run(**worker_options)
+
+
+def run_from(start: Game) -> Game:
+    return worker_manager.run(start=start, **worker_options)
 
 
 def run_in_parallel(
-    count: int, manager_class: Type[Manager], decklist: Optional[DeckList] = None
+    count: int,
+    manager_class: Type[Manager],
+    decklist: Optional[DeckList] = None,
+    options: Optional[Dict] = None,
+    exact: bool = False,
+    precision: Optional[float] = None,
+    batch: int = 500,
+    stratified: bool = False,
 ) -> List[Game]:
+    """
+    Solve count random opening hands, or with exact=True every distinct
+    opening hand once, weighted by its probability.
+
+    Given a precision in percentage points, hands are solved batch at a time
+    until the 95% confidence interval of every percentage generate_stats
+    reports is at most that wide on either side, or count hands are solved.
+
+    With stratified=True, hands are dealt by Manager.stratified_hands, in
+    proportion to how likely each count of the manager's categories is.
+    """
+    if exact and precision is not None:
+        raise ValueError("exact mode has no sampling error to reach a precision on")
     manager = manager_class(decklist)
-    managers = [manager for _ in range(count)]
-    with multiprocessing.Pool(multiprocessing.cpu_count()) as pool:
-        return pool.map(run_one, managers)
+    with multiprocessing.Pool(
+        multiprocessing.cpu_count(),
+        initializer=init_worker,
+        initargs=(manager, options or {}),
+    ) as pool:
+        if exact:
+            return pool.map(run_from, manager.opening_hands())
+        end_games = []
+        while len(end_games) < count:
+            size = count - len(end_games)
+            if precision is not None:
+                size = min(batch, size)
+            if stratified:
+                end_games += pool.map(run_from, manager.stratified_hands(size))
+            else:
+                end_games += pool.map(run_one, range(size))
+            if precision is not None and converged(
+                manager_class.generate_stats(end_games), precision
+            ):
+                break
+        return end_games
+
+
+def converged(data: List[List[str]], precision: float) -> bool:
+    percentages = [
+        datapoint[1] for datapoint in data if isinstance(datapoint[1], Percentage)
+    ]
+    if not percentages:
+        raise ValueError("precision needs generate_stats to report percentages")
+    return all(percentage.half_width() <= precision for percentage in percentages)
 
 
 def run_many(
-    n: int, manager_class: Type[Manager], decklist: Optional[DeckList] = None
+    n: int,
+    manager_class: Type[Manager],
+    decklist: Optional[DeckList] = None,
+    options: Optional[Dict] = None,
+    exact: bool = False,
+    precision: Optional[float] = None,
+    stratified: bool = False,
 ) -> Dict[str, float]:
-    return run_in_parallel(n, manager_class, decklist)
+    return run_in_parallel(
+        n,
+        manager_class,
+        decklist,
+        options,
+        exact,
+        precision=precision,
+        stratified=stratified,
+    )
 
 
 def compare_decklists(
@@ -102,23 +179,124 @@ def compare_decklists(
     manager_class: Type[Manager],
     decklists: Dict[str, DeckList],
     n=5000,
+    options: Optional[Dict] = None,
+    solve_cache: Optional[str] = None,
+    exact: bool = False,
+    precision: Optional[float] = None,
+    stratified: bool = False,
 ) -> None:
+    """
+    options are passed on to Manager.run, e.g. dict(max_nodes=10000). Caches
+    in options, like hand_cache=HandCache(), start out as given for every
+    decklist, and each worker process fills its own copy.
+
+    Given the path of a solve_cache, hands solved by earlier calls with the
+    same manager code and options are not searched again.
+
+    With exact=True, n is ignored and every distinct opening hand is solved
+    once instead, so the figures carry no sampling noise from the hand,
+    only from the cards it draws into.
+
+    Given a precision, e.g. 0.5 for ±0.5%, each decklist is sampled until its
+    figures are that precise or n hands were solved, see run_in_parallel,
+    and the table shows the intervals reached.
+
+    With stratified=True, hands are dealt in proportion to how many cards of
+    each of the manager's categories they hold, see Manager.categories.
+    """
+    if solve_cache is not None:
+        options = dict(
+            options or {}, hand_cache=SolveCache(solve_cache, manager_class, options)
+        )
     overall_data = []
     headers = []
     with open(os.path.join("output", f"{filename}.md"), "w") as outfile:
         for (decklist_title, decklist) in decklists.items():
-            end_games = run_many(n, manager_class, decklist)
+            end_games = run_many(
+                n, manager_class, decklist, options, exact, precision, stratified
+            )
             decklist_data = manager_class.generate_stats(end_games)
+            if precision is not None:
+                decklist_data = [
+                    [label, value.with_interval()]
+                    if isinstance(value, Percentage)
+                    else [label, value]
+                    for (label, value) in decklist_data
+                ]
+            # samples whose search hit a limit report a lower bound only
+            truncated = sum(1 for game in end_games if game.has_flag(TRUNCATED_FLAG))
             overall_data.append(
-                [decklist_title] + [datapoint[1] for datapoint in decklist_data]
+                [decklist_title]
+                + [datapoint[1] for datapoint in decklist_data]
+                + [f"{truncated}/{len(end_games)}"]
+            )
+            headers = (
+                ["Decklist"] + [datapoint[0] for datapoint in decklist_data] + ["Truncated"]
             )
-            headers = ["Decklist"] + [datapoint[0] for datapoint in decklist_data]
         if not overall_data:
             return
         table = generate_overall_table(title, headers, overall_data)
         print(table, file=outfile)
 
 
+# search modes compared by compare_search_modes, as keyword arguments to
+# Manager.run; the first one is the exhaustive reference
+SEARCH_MODES = {
+    "Depth-first": dict(strategy="dfs"),
+    "Depth-first, 256 states": dict(strategy="dfs", table_size=256),
+    "Breadth-first": dict(strategy="bfs"),
+    "Depth-first, bounded": dict(strategy="dfs", bound=True),
+    "Best-first": dict(strategy="best"),
+    "Beam (16)": dict(strategy="beam", beam_width=16),
+    "Beam (4)": dict(strategy="beam", beam_width=4),
+    "Beam (1)": dict(strategy="beam", beam_width=1),
+}
+
+
+def compare_search_modes(
+    filename: str,
+    title: str,
+    manager_class: Type[Manager],
+    modes: Dict[str, Dict] = SEARCH_MODES,
+    n=200,
+) -> None:
+    """
+    Run every search mode on the same n opening hands and report how far each
+    falls short of the exhaustive search, and how long it takes.
+    """
+    manager = manager_class()
+    hands = [manager.deal() for _ in range(n)]
+    results = {}
+    for (mode_title, options) in modes.items():
+        start = time()
+        values = [manager.run(start=hand.copy(), **options).value() for hand in hands]
+        results[mode_title] = (values, time() - start)
+
+    exact_values = next(iter(results.values()))[0]
+    data = []
+    for (mode_title, (values, seconds)) in results.items():
+        shortfalls = [exact - value for (exact, value) in zip(exact_values, values)]
+        data.append(
+            [
+                mode_title,
+                f"{sum(values) / n:.2f}",
+                f"{sum(shortfalls) / n:.2f}",
+                f"{100 * sum(1 for shortfall in shortfalls if shortfall <= 0) / n:.1f}%",
+                f"{1000 * seconds / n:.1f}",
+            ]
+        )
+
+    headers = ["Mode", "Mean Value", "Mean Shortfall", "Optimal", "ms / Hand"]
+    with open(os.path.join("output", f"{filename}.md"), "w") as outfile:
+        print(generate_overall_table(title, headers, data), file=outfile)
+
+
+def test_search_modes():
+    # Orcust adds no disruptions, so every end game it reaches is worth 0 and
+    # the modes cannot be told apart there
+    compare_search_modes("search_modes_synchro_dogma", "Synchro Dogma", SynchroDogmaManager)
+
+
 def test_synchro_dogma():
     decklists = {}
     decklists["2 Desires, 1 O-Lion, 1 Upstart, 3 Tuning"] = (
@@ -1,6 +1,6 @@
 import random
 
-from framework import Manager, Card, Game
+from framework import Manager, Card, requires, trigger
 
 
 class OrcustManager(Manager):
@@ -38,7 +38,7 @@ class OrcustManager(Manager):
     linkuriboh = Card("Linkuriboh", 0, "ED")
     carrier = Card("Union Carrier", 0, "ED")
 
-    deck_recipe = (
+    default_decklist = (
         (knightmare, 3),
         (girsu, 3),
         (cymbal, 2),
@@ -96,11 +96,6 @@ class OrcustManager(Manager):
 
     wyvern_fodder = [redeployment, drnm, o_return, foolish]
 
-    initial_game = Game.build_from_recipe(deck_recipe)
-
-    def __init__(self):
-        super().__init__(self.initial_game)
-
     @classmethod
     def generate_sankey_data(cls, end_games):
         gs = [[0, 0, 0], [0, 0, 0]]
@@ -120,7 +115,7 @@ class OrcustManager(Manager):
                 outer_index_combo = 1
             else:
                 inner_index_gs = 2
-                gs[outer_index_gs][inner_index_gs] += 1
+                gs[outer_index_gs][inner_index_gs] += game.weight
                 continue
 
             if game.has_flag("full combo"):
@@ -130,8 +125,8 @@ class OrcustManager(Manager):
             else:
                 inner_index_combo = 2
 
-            gs[outer_index_gs][inner_index_gs] += 1
-            combo[outer_index_combo][inner_index_combo] += 1
+            gs[outer_index_gs][inner_index_gs] += game.weight
+            combo[outer_index_combo][inner_index_combo] += game.weight
 
         label = [
             "Going Second Card Drawn",  # 0
@@ -150,10 +145,14 @@ class OrcustManager(Manager):
 
         return label, color, source, target, value
 
-    def postprocess(self, game):
+    # summoning jet spends its hopt with a second copy possibly in the grave
+    @trigger(grave=[jet], hopt=[jet])
+    def trigger_jet(self, game):
         if not game.hopt_available(self.jet) and self.jet in game.grave:
             game.move(game.grave, game.banished, self.jet)
 
+    @trigger(grave=[wand], hand=[wand])
+    def trigger_wand(self, game):
         if (
             game.hopt_available(self.wand, 2)
             and self.wand in game.grave
@@ -162,6 +161,9 @@ class OrcustManager(Manager):
             game.move(game.hand, game.monsters, self.wand)
             game.use_hopt(self.wand, 2)
 
+    # girsu sends one of these from the deck
+    @trigger(monsters=[girsu], deck=orcust_priorities)
+    def trigger_girsu(self, game):
         girsu_target = self.select_girsu_send(game)
 
         if (
@@ -172,13 +174,13 @@ class OrcustManager(Manager):
             game.use_hopt(self.girsu, 1)
             game.move(game.deck, game.grave, girsu_target)
 
+    @trigger(hand=going_second_cards)
+    def trigger_going_second_card(self, game):
         if (not game.has_flag("going second card")) and any(
             [card in game.hand for card in self.going_second_cards]
         ):
             game.add_flag("going second card")
 
-        return game
-
     def select_return_discard(self, game):
         front = [card for card in self.orcust_priorities if card not in game.grave]
         back = [card for card in self.orcust_priorities if card in game.grave]
@@ -239,6 +241,7 @@ class OrcustManager(Manager):
         # TODO, kinda hard
         return ()
 
+    @requires(hand=[o_return])
     def action_use_return(self, game):
         if self.o_return in game.hand and len(game.deck) > 1:
             selected_discard = self.select_return_discard(game)
@@ -250,6 +253,7 @@ class OrcustManager(Manager):
                 game.use_hopt(self.o_return)
                 return game
 
+    @requires(hand=[redeployment], hopt=[redeployment], resource=["orcust lock"])
     def action_use_redeployment(self, game):
         if (
             game.resource_available("orcust lock")
@@ -305,15 +309,16 @@ class OrcustManager(Manager):
             game.use_hopt(self.redeployment)
             return game
 
+    @requires(hand=[irradiator, megaform])
     def action_machina_combo(self, game):
         if self.irradiator in game.hand and self.megaform in game.hand:
             game.move(game.hand, game.grave, self.irradiator)
             game.move(game.hand, game.monsters, self.megaform)
 
-            if game.deck.cards.count(self.recycler) == 3:
+            if game.deck.count(self.recycler) == 3:
                 targets = [self.recycler, self.recycler, self.recycler]
             elif (
-                game.deck.cards.count(self.recycler) == 3 and self.citadel in game.deck
+                game.deck.count(self.recycler) == 3 and self.citadel in game.deck
             ):
                 targets = [self.recycler, self.recycler, self.citadel]
             else:
@@ -333,6 +338,7 @@ class OrcustManager(Manager):
             game.move(game.deck, game.hand, random.choice(targets))
             return game
 
+    @requires(hand=[recycler], resource=["normal summon"])
     def action_summon_recycler(self, game):
         if self.recycler in game.hand and game.resource_available("normal summon"):
             game.move(game.hand, game.monsters, self.recycler)
@@ -367,6 +373,7 @@ class OrcustManager(Manager):
 
             return game
 
+    @requires(hand=[girsu], resource=["normal summon"])
     def action_summon_girsu(self, game):
         if self.girsu in game.hand and game.resource_available("normal summon"):
             game.move(game.hand, game.monsters, self.girsu)
@@ -385,6 +392,7 @@ class OrcustManager(Manager):
 
             return game
 
+    @requires(grave=[jet], hopt=[jet], resource=["orcust lock"])
     def action_summon_jet(self, game):
         if (
             game.resource_available("orcust lock")
@@ -398,6 +406,12 @@ class OrcustManager(Manager):
             game.use_hopt(self.jet)
             return game
 
+    @requires(
+        monsters=[recycler],
+        deck=[golem],
+        hopt=[wyvern],
+        resource=["orcust lock"],
+    )
     def action_summon_wyvern(self, game):
         if (
             game.resource_available("orcust lock")
@@ -432,6 +446,7 @@ class OrcustManager(Manager):
                 game.move(game.deck, game.grave, recycler_target)
             return game
 
+    @requires(monsters=[recycler, golem], hopt=[succession], resource=["orcust lock"])
     def action_use_succession(self, game):
         if (
             game.resource_available("orcust lock")
@@ -465,6 +480,7 @@ class OrcustManager(Manager):
                 game.move(game.deck, game.grave, recycler_target)
             return game
 
+    @requires(grave=[knightmare], hopt=[knightmare])
     def action_use_knightmare(self, game):
         if (
             game.hopt_available(self.knightmare)
@@ -479,6 +495,7 @@ class OrcustManager(Manager):
                 game.move(game.deck, game.grave, knightmare_target)
                 return game
 
+    @requires(grave=[wand], hopt=[(wand, 1)])
     def action_use_wand(self, game):
         if game.hopt_available(self.wand, 1) and self.wand in game.grave:
             wand_target = self.select_wand_target(game)
@@ -489,6 +506,7 @@ class OrcustManager(Manager):
                 game.move(game.banished, game.monsters, wand_target)
                 return game
 
+    @requires(grave=[cymbal], hopt=[cymbal])
     def action_use_cymbal(self, game):
         if game.hopt_available(self.cymbal) and self.cymbal in game.grave:
             cymbal_target = self.select_cymbal_target(game)
@@ -499,6 +517,10 @@ class OrcustManager(Manager):
                 game.move(game.grave, game.monsters, cymbal_target)
                 return game
 
+    def can_summon_gizmek(self, game):
+        return self.gizmek in game.grave or self.gizmek in game.hand
+
+    @requires(hopt=[gizmek])
     def action_summon_gizmek(self, game):
         if game.hopt_available(self.gizmek) and (
             self.gizmek in game.grave or self.gizmek in game.hand
@@ -510,11 +532,15 @@ class OrcustManager(Manager):
 
             game.use_hopt(self.gizmek)
 
-            for _ in range(8):
-                game.deck.cards.pop(0)
+            game.deck.mill(8)
 
             return game
 
+    def can_summon_galatea(self, game):
+        return len(game.monsters) > 1 and any(
+            [card in game.monsters for card in self.orcust_monsters]
+        )
+
     def action_summon_galatea(self, game):
         if (
             len([card for card in game.monsters if card in self.orcust_monsters]) > 0
@@ -540,6 +566,7 @@ class OrcustManager(Manager):
                     game.move(game.deck, game.backrow, self.o_return)
             return game
 
+    @requires(monsters=[galatea], hopt=[(ding, 1)])
     def action_summon_dingirsu(self, game):
         if game.hopt_available(self.ding, 1) and self.galatea in game.monsters:
             game.monsters.remove(self.galatea)
@@ -554,6 +581,9 @@ class OrcustManager(Manager):
                     game.use_hopt(self.ding, 2)
             return game
 
+    def can_make_carrier(self, game):
+        return bool(self.select_carrier_targets(game))
+
     def action_make_carrier(self, game):
         targets = self.select_carrier_targets(game)
         if targets and (self.buster in game.hand or self.buster in game.deck):
@@ -566,6 +596,14 @@ class OrcustManager(Manager):
             else:
                 game.move(game.deck, game.backrow, self.buster)
 
+    def can_set_backrow(self, game):
+        return any(
+            [
+                card in game.hand
+                for card in [self.babel, self.crescendo, self.imperm, self.called]
+            ]
+        )
+
     def action_set_backrow(self, game):
         before = len(game.hand)
         if self.babel in game.hand:
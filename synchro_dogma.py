@@ -1,5 +1,7 @@
 from typing import List, Optional, Tuple, Dict
-from framework import Disruption, Manager, Card, Game
+from framework import (
+    Disruption, Manager, Card, Game, priority, requires, trigger
+)
 
 
 class SynchroDogmaManager(Manager):
@@ -65,6 +67,8 @@ class SynchroDogmaManager(Manager):
     hand_traps = (ash, ogre, veiler, imperm)
     going_second_cards = (ash, ogre, veiler, imperm, droplet, nibiru)
     backrow = (droplet, called, imperm, punishment)
+    spare_cards = (ash, ogre, veiler, imperm, droplet, called, punishment)
+    categories = {"starters": (righty, jet, tuning, servant)}
 
     @classmethod
     def generate_stats(cls, end_games: List[Game]) -> List[List[str]]:
@@ -81,7 +85,8 @@ class SynchroDogmaManager(Manager):
             )],
         ]
 
-    def postprocess(self, game: Game):
+    @trigger(grave=[apkalone])
+    def trigger_apkalone(self, game: Game) -> None:
         if self.apkalone in game.grave and game.hopt_available(self.apkalone):
             game.use_hopt(self.apkalone)
             if self.schism in game.deck:
@@ -89,15 +94,15 @@ class SynchroDogmaManager(Manager):
                 discard = self.select_schism_discard(game)
                 game.move(game.hand, game.grave, discard)
 
+    @trigger(grave=[construct])
+    def trigger_construct(self, game: Game) -> None:
         if self.construct in game.grave and game.hopt_available(self.construct):
             game.use_hopt(self.construct)
             if self.schism in game.grave:
                 game.move(game.grave, game.hand, self.schism)
 
-        return game
-
     def endphase(self, game: Game):
-        for card in game.hand:
+        for card in list(game.hand):
             if card in self.backrow:
                 game.move(game.hand, game.backrow, card)
 
@@ -176,6 +181,68 @@ class SynchroDogmaManager(Manager):
 
         return game
 
+    def can_still_draw(self, game: Game) -> bool:
+        return (
+            self.upstart in game.hand
+            or self.upstart in game.deck
+            or (
+                game.hopt_available(self.desires)
+                and (self.desires in game.hand or self.desires in game.deck)
+            )
+            or game.hopt_available(self.halq)
+            or (
+                game.hopt_available(self.pinpoint)
+                and any(self.pinpoint in zone for zone in (game.hand, game.deck, game.backrow))
+            )
+        )
+
+    def upper_bound(self, game: Game) -> int:
+        drawing = self.can_still_draw(game)
+        # herald, savage and auroradon only come from the extra deck or halq
+        extra_deck = game.resource_available("extra deck") or (
+            self.halq in game.monsters and game.hopt_available(self.halq)
+        )
+        recover_trap = (
+            self.auroradon in game.monsters or extra_deck
+        ) and game.hopt_available(self.auroradon, "tribute")
+
+        def reachable(card: Card) -> bool:
+            return (
+                card in game.hand
+                or (drawing and card in game.deck)
+                or (recover_trap and card.card_type == "T" and card in game.grave)
+            )
+
+        bound = 0
+
+        if any(self.schism in zone for zone in (game.hand, game.deck, game.grave, game.backrow)):
+            bound += 3
+
+        for card in (self.herald, self.savage):
+            if card in game.monsters or extra_deck:
+                bound += 1
+
+        if self.fleur in game.hand or self.fleur in game.deck:
+            bound += 1
+
+        for card in self.hand_traps:
+            if reachable(card):
+                bound += 1
+
+        for card in self.backrow:
+            if (
+                reachable(card)
+                or card in game.backrow
+                or (card == self.punishment and card in game.deck)
+            ):
+                bound += 1
+
+        return bound
+
+    def deck_in_play(self, game: Game) -> bool:
+        # tuning mills
+        return self.can_still_draw(game) or self.tuning in game.hand
+
     def select_aurorodan_trap(self, game: Game) -> Optional[Card]:
         return game.grave.get_any([self.schism, self.punishment, self.imperm])
 
@@ -287,17 +354,20 @@ class SynchroDogmaManager(Manager):
         else:
             return (self.titaniklad, self.apkalone)
 
+    @requires(hand=[pinpoint], needs=[pinpoint])
     def action_activate_pinpoint(self, game: Game) -> Optional[Game]:
         if self.pinpoint not in game.backrow and self.pinpoint in game.hand:
             game.move(game.hand, game.backrow, self.pinpoint)
             return game
 
+    @requires(hand=[upstart], needs=[upstart])
     def action_use_upstart(self, game: Game) -> Optional[Game]:
         if self.upstart in game.hand and len(game.deck) > 1:
             game.move(game.hand, game.grave, self.upstart)
             game.draw()
             return game
 
+    @requires(hand=[desires], hopt=[desires], needs=[desires])
     def action_use_desires(self, game: Game) -> Optional[Game]:
         if (
             self.desires in game.hand
@@ -306,17 +376,17 @@ class SynchroDogmaManager(Manager):
         ):
             game.move(game.hand, game.grave, self.desires)
             game.use_hopt(self.desires)
-            for _ in range(10):
-                game.deck.cards.pop(0)
+            game.deck.mill(10)
             game.draw()
             game.draw()
             return game
 
+    @requires(hand=[tuning], deck=[jet], needs=[tuning, jet])
     def action_use_tuning(self, game: Game) -> Optional[Game]:
         if self.tuning in game.hand and self.jet in game.deck:
             game.move(game.hand, game.grave, self.tuning)
             game.move(game.deck, game.hand, self.jet)
-            mill = game.deck.cards.pop(0)
+            mill = game.deck.draw()
             if self.herald in game.monsters and mill.card_type == "M":
                 # random edge case
                 game.banished.add(mill)
@@ -324,6 +394,7 @@ class SynchroDogmaManager(Manager):
                 game.grave.add(mill)
             return game
 
+    @requires(hand=[jet], resource=["normal summon"])
     def action_use_jet(self, game: Game) -> Optional[Game]:
         if self.jet in game.hand and game.resource_available("normal summon"):
             game.move(game.hand, game.monsters, self.jet)
@@ -340,6 +411,9 @@ class SynchroDogmaManager(Manager):
                     game.monsters.add(self.halq)
             return game
 
+    @requires(
+        hand=[righty], deck=[lefty], resource=["normal summon"], needs=[righty, lefty]
+    )
     def action_use_righty_driver(self, game: Game) -> Optional[Game]:
         if (
             self.righty in game.hand
@@ -356,6 +430,9 @@ class SynchroDogmaManager(Manager):
                 game.monsters.add(self.halq)
             return game
 
+    @requires(
+        hand=[righty], deck=[lefty], resource=["normal summon"], needs=[righty, lefty]
+    )
     def action_use_righty_driver_into_herald(self, game: Game) -> Optional[Game]:
         if (
             self.righty in game.hand
@@ -372,6 +449,8 @@ class SynchroDogmaManager(Manager):
                 game.monsters.add(self.herald)
             return game
 
+    @priority(1)
+    @requires(monsters=[halq], hopt=[halq])
     def action_halq(self, game: Game) -> Optional[Game]:
         if self.halq in game.monsters and game.hopt_available(self.halq):
             if self.deskbot in game.deck:
@@ -421,6 +500,7 @@ class SynchroDogmaManager(Manager):
 
             return game
 
+    @requires(monsters=[auroradon], hopt=[(auroradon, "tribute")])
     def action_recover_trap(self, game: Game) -> Optional[Game]:
         if (
             self.auroradon in game.monsters
@@ -433,6 +513,8 @@ class SynchroDogmaManager(Manager):
             game.move(game.grave, game.hand, target)
             return game
 
+    @priority(1)
+    @requires(hand=[servant], hopt=[servant])
     def action_use_nadir(self, game: Game) -> Optional[Game]:
         if self.servant in game.hand and game.hopt_available(self.servant):
             search_target = self.select_nadir_search_target(game)
@@ -448,6 +530,7 @@ class SynchroDogmaManager(Manager):
             game.use_resource("extra deck")
             return game
 
+    @requires(hand=[ecclesia])
     def action_summon_ecclesia(self, game: Game) -> Optional[Game]:
         if self.ecclesia in game.hand:
             if any(
@@ -471,6 +554,8 @@ class SynchroDogmaManager(Manager):
                 game.use_resource("extra deck")
             return game
 
+    @priority(1)
+    @requires(hand=[maximus], hopt=[maximus])
     def action_summon_maximus(self, game: Game) -> Optional[Game]:
         if self.maximus in game.hand and game.hopt_available(self.maximus):
             banish = self.select_maximus_banish(game)